@@ -0,0 +1,98 @@
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from PIL import Image
+
+from ctmapmaker.draw import ICON_NAMES, loadicon
+from ctmapmaker.geometry import imagesize
+
+
+def composite_padded(size, icons):
+    # The compositing render used before: one full-frame RGBA image
+    # per icon, then a full-frame RGB copy at the end
+    image = Image.new('RGBA', size, 'black')
+    for offset, icon in icons:
+        padded_icon = Image.new('RGBA', image.size, (0, 0, 0, 0))
+        padded_icon.paste(icon, offset)
+        image = Image.alpha_composite(image, padded_icon)
+    return image.convert('RGB')
+
+
+def composite_boxed(size, icons):
+    image = Image.new('RGB', size, 'black')
+    for offset, icon in icons:
+        image.paste(icon, offset, icon)
+    return image
+
+
+METHODS = {
+    'padded': composite_padded,
+    'boxed': composite_boxed,
+}
+
+
+def placements(mapsize, count):
+    imagew, imageh = imagesize(mapsize)
+    icons = [loadicon(name, 36) for name in sorted(ICON_NAMES)]
+    columns = int(imagew) // 40
+    return (int(imagew), int(imageh)), [
+        ((i % columns) * 40, (i // columns) * 40 % int(imageh - 36),
+         icons[i % len(icons)])
+        for i in range(count)
+    ]
+
+
+def measure(method, mapsize, count, number):
+    size, icons = placements(mapsize, count)
+    icons = [((x, y), icon) for x, y, icon in icons]
+    func = METHODS[method]
+
+    # Peak RSS is only meaningful in a fresh process per method
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    func(size, icons)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+    start = time.perf_counter()
+    for i in range(number):
+        func(size, icons)
+    elapsed = (time.perf_counter() - start) / number
+
+    return {
+        'method': method,
+        'mapsize': mapsize,
+        'icons': count,
+        'time_ms': elapsed * 1000,
+        'peak_kib': peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mapsize', type=int, default=8)
+    parser.add_argument('--icons', type=int, default=60)
+    parser.add_argument('-n', '--number', type=int, default=20)
+    parser.add_argument('--method', choices=METHODS)
+    args = parser.parse_args()
+
+    if args.method:
+        print(json.dumps(measure(
+            args.method, args.mapsize, args.icons, args.number)))
+        return
+
+    for method in METHODS:
+        output = subprocess.run(
+            [sys.executable, '-m', 'bench.composite', '--method', method,
+             '--mapsize', str(args.mapsize), '--icons', str(args.icons),
+             '--number', str(args.number)],
+            check=True, capture_output=True, text=True).stdout
+        result = json.loads(output)
+        print(f'{method:<8} {result["time_ms"]:8.2f}ms/render '
+              f'{result["peak_kib"]:8d}KiB peak')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+# Representative queries, roughly in the mix users send: single towers
+# and types, numeric filters, combinations and tile lists
+PREDICATES = [
+    '',
+    'dart',
+    'dart and ninja and not hero',
+    'startcash > 800',
+    'startround >= 6 and endround <= 60',
+    'endround > 40',
+    'maxtowers < 10',
+    'tack or ice',
+    'dart < 2',
+    'dart.count > 1',
+    'primary.count >= 3',
+    'magic',
+    'military == 0',
+    'hero',
+    'quincy',
+    'quincy in hero',
+    'quincy not in hero',
+    'map == tutorial',
+    'cubism or quad',
+    'expert',
+    'difficulty >= hard',
+    'race',
+    'lclt',
+    'boss',
+    'bosstiers > 2',
+    'relic',
+    'banner',
+    'tiletype == relic',
+    'spawn',
+    'tilecode == aab',
+    '1 < startround < 20',
+    'startcash / 2 > 400',
+    'startcash - startround * 10 > 700',
+    'dart and (ninja or sub) and startcash >= 850',
+    'farm.category == support',
+    'hero > quincy',
+    'true',
+    'AAB, ABA, bbc',
+]
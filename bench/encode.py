@@ -0,0 +1,43 @@
+import argparse
+import os
+import time
+
+from ctmapmaker.draw import render_season
+from ctmapmaker.encode import FORMATS, encode
+from ctmapmaker.season import CTMAP_ROOT, load_season
+from ctmapmaker.selection import select_tiles
+
+PREDICATES = ['', 'dart', 'true']
+
+
+def seasons():
+    for name in sorted(os.listdir(CTMAP_ROOT)):
+        if os.path.exists(os.path.join(CTMAP_ROOT, name, 'tiles.json')):
+            yield name
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=10)
+    parser.add_argument('--level', type=int)
+    parser.add_argument('seasons', nargs='*')
+    args = parser.parse_args()
+
+    for name in args.seasons or seasons():
+        season = load_season(name)
+        images = [render_season(season, select_tiles(season, predicate), 0)
+                  for predicate in PREDICATES]
+
+        print(f'season {name} (size {season.mapsize})')
+        for format in FORMATS:
+            start = time.perf_counter()
+            for i in range(args.number):
+                sizes = [len(encode(image, format, args.level))
+                         for image in images]
+            elapsed = (time.perf_counter() - start) / args.number / len(images)
+            print(f'  {format:<12} {elapsed*1000:8.2f}ms/image '
+                  f'{sum(sizes)/len(sizes)/1024:8.1f}KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import timeit
+
+from ctmapmaker.eval import (BACKENDS, MapmakerAssembler, MapmakerEval,
+                            mapmaker_compile, mapmaker_parse)
+
+# Evaluation goes through ctx[name] only, so a plain dict of numbers
+# isolates the cost of the evaluator from the predicate types
+CTX = {
+    'startcash': 850,
+    'startround': 6,
+    'endround': 60,
+    'maxtowers': 10,
+    'dart': 2,
+    'ninja': 0,
+    'sub': 1,
+    'hero': 0,
+}
+
+PREDICATES = [
+    'dart',
+    'dart and ninja and not hero',
+    'startcash > 800',
+    'startround >= 6 and endround <= 60',
+    '1 < startround < 20',
+    'startcash - startround * 10 > 700',
+    'dart and (ninja or sub) and startcash >= 850',
+    'not dart or ninja or sub or hero or maxtowers < 5',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f'{"predicate":<50}' +
+          ''.join(f'{backend:>12}' for backend in BACKENDS) +
+          '   speedup   skipped')
+    for predicate_str in PREDICATES:
+        times = {}
+        for backend in BACKENDS:
+            func = mapmaker_compile(predicate_str, backend)
+            times[backend] = timeit.timeit(
+                lambda: func(CTX), number=args.number) / args.number
+
+        asm = MapmakerAssembler().assemble(mapmaker_parse(predicate_str))
+        _, skipped = MapmakerEval(asm).run(CTX)
+
+        print(f'{predicate_str:<50}' +
+              ''.join(f'{t * 1e6:10.2f}us' for t in times.values()) +
+              f'{times["vm"] / times["closure"]:9.1f}x' +
+              f'{skipped:>6}/{len(asm)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import re
+import subprocess
+import sys
+
+MODULES = [
+    'ctmapmaker.eval',
+    'ctmapmaker.predicate',
+    'ctmapmaker.vector',
+    'ctmapmaker.draw',
+    'ctmapmaker.workers',
+    'ctmapmaker.server',
+]
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def importtime(module):
+    # Fresh interpreter each time, so nothing is imported already
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        check=True, capture_output=True, text=True).stderr
+
+    times = {}
+    for line in output.splitlines():
+        match = LINE.match(line)
+        if match:
+            own, cumulative, _, name = match.groups()
+            times[name] = int(own), int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        # Keep the fastest run of each module, the rest is noise
+        best = None
+        for i in range(args.number):
+            times = importtime(module)
+            if best is None or times[module][1] < best[module][1]:
+                best = times
+
+        print(f'{module:<24} {best[module][1]/1000:8.1f}ms')
+        top = sorted(best.items(), key=lambda item: -item[1][0])
+        for name, (own, cumulative) in top[:args.top]:
+            print(f'    {name:<40} {own/1000:8.1f}ms self')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+from bench.corpus import PREDICATES
+from bench.synthetic import generate
+
+
+def measure(func, repeat):
+    func()
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return {'min_ms': min(times), 'median_ms': statistics.median(times)}
+
+
+def run(seasons, repeat):
+    # Imported late, the modules read CTMAP_ROOT and CTMAP_CONF on import
+    from ctmapmaker.draw import (
+        BASE_LAYERS, base_layer, icon_layer, render_season)
+    from ctmapmaker.encode import FORMATS, encode
+    from ctmapmaker.eval import (
+        MapmakerLexer, mapmaker_compile_ast, mapmaker_parse)
+    from ctmapmaker.predicate import make_predicate
+    from ctmapmaker.season import load_season
+    from ctmapmaker.selection import evaluate
+
+    queries = [predicate for predicate in PREDICATES
+               if predicate.strip() and ',' not in predicate]
+    results = {}
+
+    def lex():
+        for predicate in queries:
+            list(MapmakerLexer().tokenize(predicate))
+
+    def parse():
+        for predicate in queries:
+            mapmaker_parse(predicate)
+
+    asts = [mapmaker_parse(predicate) for predicate in queries]
+
+    def compile():
+        for ast in asts:
+            mapmaker_compile_ast(ast)
+
+    results['lex'] = measure(lex, repeat)
+    results['parse'] = measure(parse, repeat)
+    results['compile'] = measure(compile, repeat)
+
+    predicates = [make_predicate(predicate) for predicate in PREDICATES]
+
+    for key, mapsize in seasons.items():
+        season = load_season(key)
+        tiles = list(season.tiles.values())
+        selections = [evaluate(season, predicate) for predicate in predicates]
+
+        def evaluate_scalar():
+            for predicate in predicates:
+                for tile in tiles:
+                    predicate(tile)
+
+        def evaluate_vector():
+            for predicate in predicates:
+                evaluate(season, predicate)
+
+        def base():
+            BASE_LAYERS.clear()
+            base_layer(season, 0)
+
+        def icons():
+            image = base_layer(season, 0).copy()
+            for offset, icon in icon_layer(season, 0, False):
+                image.paste(icon, offset, icon)
+
+        def draw():
+            for selected in selections:
+                render_season(season, selected, 0)
+
+        results[f'evaluate_scalar/{mapsize}'] = measure(
+            evaluate_scalar, repeat)
+        results[f'evaluate_vector/{mapsize}'] = measure(
+            evaluate_vector, repeat)
+        results[f'base_layer/{mapsize}'] = measure(base, repeat)
+        results[f'icons/{mapsize}'] = measure(icons, repeat)
+        results[f'draw/{mapsize}'] = measure(draw, repeat)
+
+        image = render_season(season, selections[1], 0)
+        for format in FORMATS:
+            results[f'encode_{format}/{mapsize}'] = measure(
+                lambda: encode(image, format), repeat)
+
+    return results
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], check=True,
+            capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--repeat', type=int, default=10)
+    parser.add_argument('-o', '--output')
+    parser.add_argument('--compare')
+    parser.add_argument('--data',
+                        help='directory for the synthetic data, kept after '
+                             'the run')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='ctmapmaker-bench-') as tmp:
+        ctmap, confpath, seasons = generate(args.data or tmp)
+        os.environ['CTMAP_ROOT'] = ctmap
+        os.environ['CTMAP_CONF'] = confpath
+
+        output = {
+            'commit': commit(),
+            'python': platform.python_version(),
+            'repeat': args.repeat,
+            'predicates': len(PREDICATES),
+            'stages': run(seasons, args.repeat),
+        }
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['stages']
+
+    # Times are for the whole corpus of predicates
+    for stage, result in output['stages'].items():
+        line = f'{stage:<28} {result["min_ms"]:10.3f}ms'
+        if stage in previous:
+            ratio = previous[stage]['min_ms'] / result['min_ms']
+            line += f' {previous[stage]["min_ms"]:10.3f}ms {ratio:6.2f}x'
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import random
+
+import yaml
+
+from ctmapmaker.coords import MYRIN_CODEMAP, TILECOORDS
+
+ASSETS = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                      'ctmapmaker', 'assets')
+
+TOWERS = {
+    'primary': ['DartMonkey', 'BoomerangMonkey', 'BombShooter',
+                'TackShooter', 'IceMonkey', 'GlueGunner'],
+    'military': ['SniperMonkey', 'MonkeySub', 'MonkeyBuccaneer', 'MonkeyAce',
+                 'HeliPilot', 'MortarMonkey', 'DartlingGunner'],
+    'magic': ['WizardMonkey', 'SuperMonkey', 'NinjaMonkey', 'Alchemist',
+              'Druid'],
+    'support': ['BananaFarm', 'SpikeFactory', 'MonkeyVillage',
+                'EngineerMonkey', 'BeastHandler'],
+}
+
+HEROES = ['Quincy', 'Gwendolin', 'StrikerJones', 'ObynGreenfoot',
+          'CaptainChurchill', 'Benjamin', 'Ezili', 'PatFusty', 'Adora',
+          'AdmiralBrickell', 'Etienne', 'Sauda', 'Psi', 'Geraldo', 'Corvus',
+          'Rosalia']
+
+MAPS = ['Tutorial', 'InTheLoop', 'Cubism', 'LogsMap', 'Quad', 'Ravine',
+        'FloodedValley', 'Infernal', 'Bloody', 'Workshop', 'DarkCastle',
+        'Muddy', 'Ouch', 'Sanctuary']
+
+# Relic icons that ship in assets, so synthetic seasons render
+RELICS = sorted(
+    name[:-len('.png')] for name in os.listdir(ASSETS)
+    if name.endswith('.png') and name not in (
+        'CTPointsBanner.png', 'LeastCash.png', 'LeastTiers.png'))
+
+TILETYPES = ['Regular'] * 6 + ['Banner', 'Relic', 'TeamFirstCapture']
+GAMETYPES = [2, 8, 9, 4]
+BOSS = 4
+
+
+def stub_conf():
+    return {
+        'towers': {
+            **{category: list(towers) for category, towers in TOWERS.items()},
+            'regular': sum(TOWERS.values(), []),
+            'hero': list(HEROES),
+        },
+        'maps': [{'id': map, 'difficulty': i % 4}
+                 for i, map in enumerate(MAPS)],
+        'relics': list(RELICS),
+    }
+
+
+def distance(coord):
+    absx, absy = abs(coord[0]), abs(coord[1])
+    if absx > absy:
+        return absx
+    return (absx + absy) // 2
+
+
+def tile(rnd):
+    tiletype = rnd.choice(TILETYPES)
+    gametype = rnd.choice(GAMETYPES)
+
+    items = [{'tower': tower, 'max': rnd.choice([0, 0, 0, 1, 2, -1]),
+              'isHero': False}
+             for tower in sum(TOWERS.values(), [])]
+    items.append({'tower': 'ChosenPrimaryHero', 'max': rnd.choice([0, 0, 1]),
+                  'isHero': False})
+    items.extend({'tower': hero, 'max': rnd.choice([0, 0, 0, 1]),
+                  'isHero': True}
+                 for hero in HEROES)
+
+    gamedata = {
+        'selectedMap': rnd.choice(MAPS),
+        'selectedDifficulty': rnd.choice(
+            ['Easy', 'Medium', 'Hard', 'Impoppable']),
+        'subGameType': gametype,
+        'dcModel': {
+            'startRules': {
+                'cash': rnd.choice([650, 850, 1200, 20000]),
+                'round': rnd.choice([1, 6, 10, 40]),
+                'endRound': rnd.choice([-1, 40, 60, 80]),
+            },
+            'maxTowers': rnd.choice([-1, 5, 10]),
+            'towers': {'_items': items},
+        },
+    }
+    if gametype == BOSS:
+        gamedata['bossData'] = {'bossBloon': rnd.randrange(7),
+                                'TierCount': rnd.randrange(1, 6)}
+
+    return {
+        'TileType': tiletype,
+        'RelicType': rnd.choice(RELICS) if tiletype == 'Relic' else 'None',
+        'GameData': gamedata,
+    }
+
+
+def season(mapsize, seed):
+    # The ring at distance mapsize holds the team starts, tiles are inside
+    rnd = random.Random(seed)
+    rawcodes = {tilecode: raw for raw, tilecode in MYRIN_CODEMAP.items()}
+    return {
+        rawcodes.get(tilecode, tilecode): tile(rnd)
+        for tilecode, coord in TILECOORDS.items()
+        if distance(coord) < mapsize
+    }
+
+
+def generate(root, sizes=(8, 7, 6), seed=0):
+    os.makedirs(os.path.join(root, 'conf'), exist_ok=True)
+    confpath = os.path.join(root, 'conf', 'conf.yaml')
+    with open(confpath, 'w') as f:
+        yaml.safe_dump(stub_conf(), f)
+
+    seasons = {}
+    for i, mapsize in enumerate(sizes, 1):
+        rnd = random.Random(seed + i)
+        path = os.path.join(root, 'ctmap', str(i))
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'tiles.json'), 'w') as f:
+            json.dump(season(mapsize, seed + i), f)
+        with open(os.path.join(path, 'event_relics.json'), 'w') as f:
+            json.dump(rnd.sample(RELICS, 6), f)
+        with open(os.path.join(path, 'daily_powers.json'), 'w') as f:
+            json.dump(rnd.sample(RELICS, 3), f)
+        seasons[str(i)] = mapsize
+
+    return os.path.join(root, 'ctmap'), confpath, seasons
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[8, 7, 6])
+    args = parser.parse_args()
+
+    ctmap, confpath, seasons = generate(args.root, args.sizes, args.seed)
+    print(f'CTMAP_ROOT={ctmap} CTMAP_CONF={confpath}')
+    for key, mapsize in seasons.items():
+        print(f'season {key}: size {mapsize}')
+
+
+if __name__ == '__main__':
+    main()
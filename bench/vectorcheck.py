@@ -0,0 +1,107 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from bench.corpus import PREDICATES
+from bench.synthetic import generate
+
+# The large constants overflow 64 bit ints when multiplied or added
+ATOMS = ['0', '1', '2', '3', '850', '3037000500', '9223372036854775807',
+         'true', 'false', 'inf', 'dart', 'ninja',
+         'sub', 'primary', 'magic', 'hero', 'quincy', 'startcash',
+         'startround', 'endround', 'maxtowers', 'bosstiers', 'spawn', 'lclt',
+         'boss', 'cubism', 'expert', 'hard', 'relic', 'banner', 'aab']
+BINARY = ['+', '-', '*', '/', '<', '<=', '>', '>=', '==', '!=', 'and', 'or',
+          'in', 'not in']
+
+
+def expression(rnd, depth=3):
+    if depth == 0 or rnd.random() < 0.3:
+        atom = rnd.choice(ATOMS)
+        if rnd.random() < 0.1:
+            atom += '.count'
+        return atom
+
+    choice = rnd.random()
+    if choice < 0.15:
+        return f'not {expression(rnd, depth - 1)}'
+    if choice < 0.2:
+        return f'-{expression(rnd, depth - 1)}'
+    if choice < 0.3:
+        return f'({expression(rnd, depth - 1)})'
+    return (f'{expression(rnd, depth - 1)} {rnd.choice(BINARY)} '
+            f'{expression(rnd, depth - 1)}')
+
+
+def scalar(season, predicate):
+    try:
+        return [tilecode for tilecode, tile in season.tiles.items()
+                if predicate(tile)]
+    except Exception as e:
+        return type(e).__name__
+
+
+def check(seasons, queries):
+    # Imported late, the modules read CTMAP_ROOT and CTMAP_CONF on import
+    from ctmapmaker import vector
+    from ctmapmaker.predicate import make_predicate
+    from ctmapmaker.season import load_season
+
+    checked = vectorized = 0
+    mismatches = []
+    for key in seasons:
+        season = load_season(key)
+        for query in queries:
+            try:
+                predicate = make_predicate(query)
+            except Exception:
+                continue
+
+            checked += 1
+            try:
+                selected = vector.select(season, predicate)
+            except Exception as e:
+                selected = type(e).__name__
+            if selected is None:
+                continue
+
+            vectorized += 1
+            expected = scalar(season, predicate)
+            if selected != expected:
+                mismatches.append((key, query, selected, expected))
+
+    return checked, vectorized, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    queries = PREDICATES + [expression(rnd) for i in range(args.number)]
+
+    with tempfile.TemporaryDirectory(prefix='ctmapmaker-bench-') as tmp:
+        ctmap, confpath, seasons = generate(tmp)
+        os.environ['CTMAP_ROOT'] = ctmap
+        os.environ['CTMAP_CONF'] = confpath
+        checked, vectorized, mismatches = check(seasons, queries)
+
+    # The vector engine must agree with per-tile evaluation exactly,
+    # including leaving errors to the scalar path
+    for key, query, selected, expected in mismatches:
+        if not isinstance(selected, str):
+            selected = f'{len(selected)} tiles'
+        if not isinstance(expected, str):
+            expected = f'{len(expected)} tiles'
+        print(f'season {key}: {query!r} vector {selected} scalar {expected}')
+    print(f'{checked} checked, {vectorized} vectorized, '
+          f'{len(mismatches)} mismatches')
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import collections
+import threading
+
+
+class LRUCache:
+    def __init__(self, maxsize, weigh=None):
+        self.maxsize = maxsize
+        self.weigh = weigh
+        self.weight = 0
+        self.lock = threading.Lock()
+        self.data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value, weight = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        weight = self.weigh(value) if self.weigh else 1
+        with self.lock:
+            if key in self.data:
+                self.weight -= self.data.pop(key)[1]
+            self.data[key] = value, weight
+            self.weight += weight
+            while self.weight > self.maxsize:
+                _, (_, evicted) = self.data.popitem(last=False)
+                self.weight -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.data),
+                'weight': self.weight,
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,130 @@
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+
+import yaml
+
+CONF_PATH = os.environ.get('CTMAP_CONF', '/ctmapgen-data/conf/conf.yaml')
+
+# The C loader is several times faster on the large conf, use it when
+# PyYAML was built with libyaml
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def load_conf(path=CONF_PATH):
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+class Config:
+    def __init__(self, path):
+        self.path = path
+        self.version = os.stat(path).st_mtime_ns
+        self.data = load_conf(path)
+        self.derived = {}
+
+
+# Functions whose results depend on the conf, rebuilt for every version
+DERIVED = []
+
+_current = None
+# The version before the last reload, still pinned by requests that
+# started on it
+_previous = None
+# The file version that last failed to load, not retried until it changes
+_failed = None
+_reload_lock = threading.Lock()
+# The version a request started with, if it pinned one
+_pinned = contextvars.ContextVar('config', default=None)
+
+
+def current():
+    config = _pinned.get()
+    if config is None:
+        config = _current or reload()
+    return config
+
+
+def conf():
+    return current().data
+
+
+def derived(func):
+    @functools.wraps(func)
+    def wrapper():
+        config = current()
+        try:
+            return config.derived[wrapper]
+        except KeyError:
+            pass
+        value = config.derived[wrapper] = func()
+        return value
+
+    DERIVED.append(wrapper)
+    return wrapper
+
+
+def pin(config=None):
+    return _pinned.set(config or current())
+
+
+def unpin(token):
+    _pinned.reset(token)
+
+
+@contextlib.contextmanager
+def pinned(config=None):
+    token = pin(config)
+    try:
+        yield
+    finally:
+        unpin(token)
+
+
+def _unchanged():
+    try:
+        version = os.stat(CONF_PATH).st_mtime_ns
+    except FileNotFoundError:
+        # Keep serving the loaded version while the file is replaced
+        return _current is not None
+    return _current is not None and version in (_current.version, _failed)
+
+
+def reload(force=False):
+    global _current, _previous, _failed
+    # A stat without the lock, cheap enough to call for every request
+    if not force and _unchanged():
+        return _current
+
+    with _reload_lock:
+        if not force and _unchanged():
+            return _current
+
+        # Build every derived structure before publishing the new version,
+        # so requests never see half of it
+        version = os.stat(CONF_PATH).st_mtime_ns
+        try:
+            config = Config(CONF_PATH)
+            with pinned(config):
+                for func in DERIVED:
+                    func()
+        except Exception:
+            _failed = version
+            raise
+
+        _previous, _current = _current, config
+        return config
+
+
+def at_version(version):
+    # Another process may have pinned a version this one has already
+    # replaced, or not loaded yet
+    for config in (_current, _previous):
+        if config is not None and config.version == version:
+            return config
+    config = reload()
+    if config.version == version:
+        return config
+    return None
@@ -1,68 +1,20 @@
-import json
+import functools
 import math
 import os
 import sys
+import threading
 
 from PIL import Image, ImageDraw, ImageFont
 from aggdraw import Draw, Brush, Pen
 
-from ctmapmaker.coords import TILECOORDS, MYRIN_CODEMAP
+from ctmapmaker.cache import LRUCache
 from ctmapmaker.error import MapmakerError
-from ctmapmaker.predicate import make_predicate
+from ctmapmaker.geometry import geometry, imagesize
+from ctmapmaker.metrics import timed
+from ctmapmaker.season import load_season
+from ctmapmaker.selection import select_tiles
 
 ASSETS = os.path.join(os.path.dirname(__file__), 'assets')
-HEXSIZE = 32
-
-
-def HexagonGenerator(edge_length, offsetx=0, offsety=0):
-    col_width = edge_length * 3
-    row_height = math.sin(math.pi / 3) * edge_length
-
-    def gen(row, col):
-        vertices = []
-        x = (col + 0.5 * (row % 2)) * col_width
-        y = row * row_height
-        for angle in range(0, 360, 60):
-            x += math.cos(math.radians(angle)) * edge_length
-            y += math.sin(math.radians(angle)) * edge_length
-            vertices.append(x + offsetx)
-            vertices.append(y + offsety)
-
-        center = (
-            x + edge_length / 2 + offsetx,
-            y + math.sin(math.radians(60)) * edge_length + offsety
-        )
-        return center, vertices
-
-    return gen
-
-
-def tilecoord2gencoord(coord, pov):
-    tilex, tiley = coord
-    if pov == 0:
-        return tiley, -tilex // 2
-    elif pov == 1:
-        return (
-            (tilex * 3 + tiley) // 2,
-            (-tilex + tiley) // 4
-        )
-    elif pov == 2:
-        return (
-            (tilex * 3 - tiley) // 2,
-            (tilex + tiley) // 4
-        )
-    elif pov == 3:
-        return -tiley, tilex // 2
-    elif pov == 4:
-        return (
-            (-tilex * 3 - tiley) // 2,
-            (tilex - tiley) // 4
-        )
-    elif pov == 5:
-        return (
-            (-tilex * 3 + tiley) // 2,
-            (-tilex - tiley) // 4
-        )
 
 
 def tileicon(tiledata):
@@ -73,34 +25,104 @@ def tileicon(tiledata):
     return None
 
 
-def loadtiles(season):
-    try:
-        f = open(f'/ctmap/{season}/tiles.json')
-    except FileNotFoundError:
-        raise MapmakerError("I don't have the challenge data for that event!")
+@functools.cache
+def loadfont(size):
+    return ImageFont.truetype(
+        os.path.join(ASSETS, 'LuckiestGuy-Regular.ttf'), size)
 
-    with f:
-        tiles_raw = json.load(f)
 
-    tiles = {}
-    for tilecode, tiledata in tiles_raw.items():
-        tilecode = MYRIN_CODEMAP.get(tilecode, tilecode)
-        tiles[tilecode] = tiledata
-        tiledata['Code'] = tilecode
+# FreeType faces are not safe to render from several threads at once
+_font_lock = threading.Lock()
 
-    return tiles
 
+@functools.lru_cache(maxsize=8192)
+def labelsprite(label, size, anchor, startx, starty):
+    # Masks for the black outline and the white text. They are rendered
+    # at the same subpixel offset draw.text would use at the target
+    # position, so blitting them gives the same pixels.
+    font = loadfont(size)
+    with _font_lock:
+        left, top, right, bottom = font.getbbox(label, anchor=anchor)
+        originx, originy = 3 - math.floor(left), 3 - math.floor(top)
+        spritesize = (math.ceil(right) + originx + 3,
+                      math.ceil(bottom) + originy + 3)
+        x, y = originx + startx, originy + starty
+
+        outline = Image.new('L', spritesize, 0)
+        draw = ImageDraw.Draw(outline)
+        for dx, dy in ((1, 1), (1, -1), (-1, 1), (-1, -1)):
+            draw.text((x+dx, y+dy), label, fill=255, anchor=anchor, font=font)
+
+        text = Image.new('L', spritesize, 0)
+        draw = ImageDraw.Draw(text)
+        draw.text((x, y), label, fill=255, anchor=anchor, font=font)
+
+    return (originx, originy), outline, text
+
+
+def drawlabel(image, xy, label, size, anchor):
+    x, y = xy
+    (originx, originy), outline, text = labelsprite(
+        label, size, anchor, x - int(x), y - int(y))
+    offset = (int(x) - originx, int(y) - originy)
+    image.paste('black', offset, outline)
+    image.paste('white', offset, text)
 
-def render(season, predicate_str, teamid):
-    tiles = loadtiles(season)
-    predicate = make_predicate(predicate_str)
 
-    if 'AAA' in tiles:
-        mapsize, outercode = 8, 'Z'
-    elif 'AAB' in tiles:
-        mapsize, outercode = 7, 'A'
+BASE_LAYERS = LRUCache(16)
+ICON_LAYERS = LRUCache(32)
+
+
+ICON_NAMES = frozenset(name for name in os.listdir(ASSETS)
+                       if name.endswith(('.png', '.webp')))
+
+
+def resizeicon(icon, size):
+    iconw, iconh = icon.size
+    if iconw >= iconh:
+        iconh = iconh * size / iconw
+        iconw = size
     else:
-        mapsize, outercode = 6, 'B'
+        iconw = iconw * size / iconh
+        iconh = size
+    return icon.resize((int(iconw), int(iconh))).convert('RGBA')
+
+
+# Decoding and resizing every asset up front was most of the import
+# time, load each icon the first time a season uses it instead
+@functools.cache
+def loadicon(name, size):
+    with Image.open(os.path.join(ASSETS, name)) as icon:
+        return resizeicon(icon, size)
+
+
+def placeicon(icon, center, size=36):
+    icon = loadicon(icon, size)
+    iconw, iconh = icon.size
+    centerx, centery = center
+    return (int(centerx-iconw/2), int(centery-iconh/2)), icon
+
+
+def missingicons(season, legend):
+    icons = {tileicon(tiledata) for tiledata in season.tiles.values()}
+    icons.discard(None)
+    # The legend is only drawn when nothing is selected, an unknown
+    # power must not break every other render of the season
+    if legend:
+        icons.update(f'{relic}.png' for relic in season.daily_powers)
+        icons.update(f'{relic}.png' for relic in season.event_relics)
+    return sorted(icon for icon in icons if icon not in ICON_NAMES)
+
+
+def base_layer(season, teamid):
+    # Hex outlines and team starts only depend on the layout and POV
+    key = (season.mapsize, teamid, tuple(season.tiles))
+    image = BASE_LAYERS.get(key)
+    if image is not None:
+        return image
+
+    mapsize = season.mapsize
+    outercode = {8: 'Z', 7: 'A', 6: 'B'}[mapsize]
 
     teamstarts = {
         f'AA{outercode}': (160, 95, 240),
@@ -111,117 +133,107 @@ def render(season, predicate_str, teamid):
         f'FA{outercode}': (229, 80, 73),
     }
 
-    imagew = 20 + (3 * mapsize + 2) * HEXSIZE
-    imageh = 18 + (4 * mapsize + 2) * HEXSIZE * math.sin(math.pi / 3)
-    offx = imagew/2 - HEXSIZE/2
-    offy = imageh/2 - HEXSIZE * math.sin(math.pi / 3)
-    image = Image.new('RGBA', (int(imagew), int(imageh)), 'black')
+    imagew, imageh = imagesize(mapsize)
+    image = Image.new('RGB', (int(imagew), int(imageh)), 'black')
     draw = Draw(image)
-    hexagon_generator = HexagonGenerator(HEXSIZE, offx, offy)
-    icons = []
-    labels = []
-    selected_tiles = []
-
-    def paste_icon(icon, center, size=36):
-        icon = Image.open(os.path.join(ASSETS, icon))
-        iconw, iconh = icon.size
-        if iconw >= iconh:
-            iconh = iconh * size / iconw
-            iconw = size
-        else:
-            iconw = iconw * size / iconh
-            iconh = size
-
-        centerx, centery = center
-        icon = icon.resize((int(iconw), int(iconh)))
-        icons.append(((int(centerx-iconw/2), int(centery-iconh/2)), icon))
-
-    def bordered(vertices, center, size):
-        result = []
-        for i in range(0, len(vertices), 2):
-            vx, vy = vertices[i], vertices[i+1]
-            cx, cy = center
-            d = math.sqrt((vx - cx) ** 2 + (vy - cy) ** 2)
-            result.append(vx + size/d * (cx - vx))
-            result.append(vy + size/d * (cy - vy))
-        return result
+    hexes = geometry(mapsize, teamid)
 
     for tilecode, fillcolor in teamstarts.items():
-        row, col = tilecoord2gencoord(TILECOORDS[tilecode], teamid)
-        center, vertices = hexagon_generator(row, col)
-        draw.polygon(vertices, Pen('white', 2), Brush(fillcolor))
+        draw.polygon(
+            hexes.hexagon(tilecode), Pen('white', 2), Brush(fillcolor))
 
-    num_selected = 0
-    for tilecode, tiledata in tiles.items():
-        row, col = tilecoord2gencoord(TILECOORDS[tilecode], teamid)
+    for tilecode in season.tiles:
+        draw.polygon(hexes.hexagon(tilecode), Pen('white', 2), Brush('black'))
 
-        tiledata['MapSize'] = mapsize
-        selected = predicate(tiledata)
-        fillcolor = 'grey' if selected else 'black'
-        icon = tileicon(tiledata)
+    draw.flush()
+    BASE_LAYERS.put(key, image)
+    return image
 
-        center, vertices = hexagon_generator(row, col)
-        draw.polygon(vertices, Pen('white', 2), Brush(fillcolor))
 
+def icon_layer(season, teamid, legend):
+    key = (season.key, season.version, teamid, legend)
+    icons = ICON_LAYERS.get(key)
+    if icons is not None:
+        return icons
+
+    missing = missingicons(season, legend)
+    if missing:
+        raise MapmakerError(f'Missing icons: {", ".join(missing)}')
+
+    imagew, imageh = imagesize(season.mapsize)
+    hexes = geometry(season.mapsize, teamid)
+    icons = []
+
+    for tilecode, tiledata in season.tiles.items():
+        icon = tileicon(tiledata)
         if icon:
-            paste_icon(icon, center)
-        if selected:
-            labels.append((center, tilecode))
-            selected_tiles.append(tilecode)
-            num_selected += 1
-
-    if not num_selected:
-        with open(f'/ctmap/{season}/event_relics.json') as f:
-            event_relics = json.load(f)
-        with open(f'/ctmap/{season}/daily_powers.json') as f:
-            daily_powers = json.load(f)
+            icons.append(placeicon(icon, hexes.center(tilecode)))
 
+    if legend:
         centery = imageh - 30
         centerx = imagew - 30
 
-        for relic in daily_powers[::-1]:
-            paste_icon(f'{relic}.png', (centerx, centery))
+        for relic in season.daily_powers[::-1]:
+            icons.append(placeicon(f'{relic}.png', (centerx, centery)))
             centerx -= 40
 
         centery -= 48
         centerx = imagew - 30
-        for relic in event_relics[::-1]:
-            paste_icon(f'{relic}.png', (centerx, centery))
+        for relic in season.event_relics[::-1]:
+            icons.append(placeicon(f'{relic}.png', (centerx, centery)))
             centerx -= 40
 
-    draw.flush()
+    ICON_LAYERS.put(key, icons)
+    return icons
 
-    for offset, icon in icons:
-        padded_icon = Image.new('RGBA', image.size, (0, 0, 0, 0))
-        padded_icon.paste(icon, offset)
-        image = Image.alpha_composite(image, padded_icon)
 
-    if labels:
-        draw = ImageDraw.Draw(image)
-        font = ImageFont.truetype(
-            os.path.join(ASSETS, 'LuckiestGuy-Regular.ttf'), 14)
+def render(season, predicate_str, teamid):
+    season = load_season(season)
+    selected_tiles = select_tiles(season, predicate_str)
+    return render_season(season, selected_tiles, teamid), list(selected_tiles)
+
 
+def render_season(season, selected_tiles, teamid):
+    num_selected = len(selected_tiles)
+
+    imagew, imageh = imagesize(season.mapsize)
+    hexes = geometry(season.mapsize, teamid)
+    labels = []
+
+    with timed('draw'):
+        # The cached layers are shared, only ever draw on a copy
+        image = base_layer(season, teamid).copy()
+
+        # aggdraw copies the whole frame in and out, skip it if unused.
+        # Selected hexes are stroked again over their already drawn
+        # neighbours, so shared edges are a little brighter than when
+        # every hex was drawn once in tile order.
+        if selected_tiles:
+            draw = Draw(image)
+
+            for tilecode in selected_tiles:
+                draw.polygon(
+                    hexes.hexagon(tilecode), Pen('white', 2), Brush('grey'))
+                labels.append((hexes.center(tilecode), tilecode))
+
+            draw.flush()
+
+    with timed('composite'):
+        # The legend of event relics and daily powers is only shown
+        # when nothing is selected. Pasting with the icon as its own mask
+        # blends it into its bounding box only.
+        for offset, icon in icon_layer(season, teamid, not num_selected):
+            image.paste(icon, offset, icon)
+
+    with timed('labels'):
         for center, label in labels:
             cx, cy = center
-            cy += 14
-            draw.text((cx+1, cy+1), label, fill='black', anchor='mm', font=font)
-            draw.text((cx+1, cy-1), label, fill='black', anchor='mm', font=font)
-            draw.text((cx-1, cy+1), label, fill='black', anchor='mm', font=font)
-            draw.text((cx-1, cy-1), label, fill='black', anchor='mm', font=font)
-            draw.text((cx, cy), label, fill='white', anchor='mm', font=font)
-
-    if num_selected:
-        cx, cy = 15, imageh - 15
-        label = str(num_selected)
-        font = ImageFont.truetype(
-            os.path.join(ASSETS, 'LuckiestGuy-Regular.ttf'), 28)
-        draw.text((cx+1, cy+1), label, fill='black', anchor='lb', font=font)
-        draw.text((cx+1, cy-1), label, fill='black', anchor='lb', font=font)
-        draw.text((cx-1, cy+1), label, fill='black', anchor='lb', font=font)
-        draw.text((cx-1, cy-1), label, fill='black', anchor='lb', font=font)
-        draw.text((cx, cy), label, fill='white', anchor='lb', font=font)
-
-    return image.convert('RGB'), selected_tiles
+            drawlabel(image, (cx, cy + 14), label, 14, 'mm')
+
+        if num_selected:
+            drawlabel(image, (15, imageh - 15), str(num_selected), 28, 'lb')
+
+    return image
 
 
 def main():
@@ -0,0 +1,57 @@
+import zlib
+from io import BytesIO
+
+from PIL import Image
+
+from ctmapmaker.error import MapmakerError
+
+
+def _png(image, fp, level):
+    image.save(fp, 'PNG', compress_level=6 if level is None else level)
+
+
+def _png_palette(image, fp, level):
+    # The map is a few flat colours plus small icons, which fits a
+    # 256 colour palette with little visible loss
+    image = image.quantize(256, method=Image.Quantize.FASTOCTREE)
+    _png(image, fp, level)
+
+
+def _png_fast(image, fp, level):
+    image.save(fp, 'PNG', compress_level=1 if level is None else level,
+               compress_type=zlib.Z_RLE)
+
+
+def _webp(image, fp, level):
+    # For lossless WebP quality is the compression effort. The slower
+    # methods barely shrink these maps, so only scale the effort.
+    quality = 80 if level is None else round(level * 100 / 9)
+    image.save(fp, 'WEBP', lossless=True, method=0, quality=quality)
+
+
+# name -> (mimetype, extension, encoder)
+FORMATS = {
+    'png': ('image/png', 'png', _png),
+    'png-palette': ('image/png', 'png', _png_palette),
+    'png-fast': ('image/png', 'png', _png_fast),
+    'webp': ('image/webp', 'webp', _webp),
+}
+
+
+def check_format(format, level):
+    if format not in FORMATS:
+        raise MapmakerError(
+            f'Unknown format {format}. Valid formats: {", ".join(FORMATS)}')
+    # JSON true and false arrive as bools, which are ints to Python
+    if level is not None and (
+            not isinstance(level, int) or isinstance(level, bool) or
+            not 0 <= level <= 9):
+        raise MapmakerError('Compression level must be between 0 and 9')
+
+
+def encode(image, format='png', level=None):
+    check_format(format, level)
+
+    fp = BytesIO()
+    FORMATS[format][2](image, fp, level)
+    return fp.getvalue()
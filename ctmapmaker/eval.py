@@ -1,3 +1,10 @@
+import hashlib
+import operator
+import os
+import pickle
+from types import SimpleNamespace
+
+import sly
 from sly import Lexer, Parser
 
 from ctmapmaker.error import MapmakerError
@@ -156,6 +163,40 @@ class MapmakerParser(Parser):
         else:
             raise MapmakerError('Parse error in input. EOF')
 
+    # Overrides sly's private table builder. Building the LALR tables is
+    # most of the cost of importing this module, so they are kept in
+    # __pycache__ while the grammar stays the same.
+    @classmethod
+    def _Parser__build_lrtables(cls):
+        digest = hashlib.sha256(
+            f'{sly.__version__}\n{cls.precedence}\n{cls._grammar}'.encode()
+        ).hexdigest()[:16]
+        path = os.path.join(os.path.dirname(__file__), '__pycache__',
+                            f'parsetab-{digest}.pickle')
+
+        try:
+            with open(path, 'rb') as f:
+                lr_action, lr_goto, defaulted_states = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+        else:
+            cls._lrtable = SimpleNamespace(
+                lr_action=lr_action, lr_goto=lr_goto,
+                defaulted_states=defaulted_states)
+            return True
+
+        built = super()._Parser__build_lrtables()
+        tables = (cls._lrtable.lr_action, cls._lrtable.lr_goto,
+                  cls._lrtable.defaulted_states)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f'{path}.{os.getpid()}', 'wb') as f:
+                pickle.dump(tables, f)
+            os.replace(f'{path}.{os.getpid()}', path)
+        except OSError:
+            pass
+        return built
+
 
 class MapmakerAssembler():
     @staticmethod
@@ -163,6 +204,19 @@ class MapmakerAssembler():
         asm = []
 
         def walk(ast):
+            if ast[0] in ('op_and', 'op_or'):
+                # Leave the left operand on the stack as the result if it
+                # already decides the answer, skipping the right operand
+                walk(ast[1])
+                jump = len(asm)
+                asm.append(None)
+                walk(ast[2])
+                if ast[0] == 'op_and':
+                    asm[jump] = ('op_jump_if_false_or_pop', len(asm))
+                else:
+                    asm[jump] = ('op_jump_if_true_or_pop', len(asm))
+                return
+
             args = []
 
             for item in ast[1:]:
@@ -242,15 +296,15 @@ class MapmakerEval():
 
         stack.append(result)
 
-    def op_and(self, ctx, stack):
-        y = stack.pop()
-        x = stack.pop()
-        stack.append(x and y)
+    def op_jump_if_false_or_pop(self, ctx, stack, target):
+        if not stack[-1]:
+            return target
+        stack.pop()
 
-    def op_or(self, ctx, stack):
-        y = stack.pop()
-        x = stack.pop()
-        stack.append(x or y)
+    def op_jump_if_true_or_pop(self, ctx, stack, target):
+        if stack[-1]:
+            return target
+        stack.pop()
 
     def op_not(self, ctx, stack):
         x = stack.pop()
@@ -262,25 +316,149 @@ class MapmakerEval():
     def op_getname(self, ctx, stack, name):
         stack.append(ctx[name])
 
-    def eval(self, ctx):
+    def run(self, ctx):
         stack = []
+        pc = 0
+        executed = 0
 
-        for stmt in self.asm:
-            op, *args = stmt
-            getattr(self, op)(ctx, stack, *args)
+        while pc < len(self.asm):
+            op, *args = self.asm[pc]
+            target = getattr(self, op)(ctx, stack, *args)
+            pc = pc + 1 if target is None else target
+            executed += 1
 
         assert len(stack) == 1
         result, = stack
+        # Jumps only go forward, so nothing runs twice
+        return result, len(self.asm) - executed
+
+    def eval(self, ctx):
+        result, _ = self.run(ctx)
         return result
 
 
-def mapmaker_compile(text):
-    tokens = MapmakerLexer().tokenize(text)
-    ast = MapmakerParser().parse(tokens)
+def _op_in(x, y):
+    # We don't want the default __contains__
+    # which calls __getitem__
+    if hasattr(y, 'contains'):
+        return y.contains(x)
+    return False
+
+
+def _op_ni(x, y):
+    if hasattr(y, 'contains'):
+        return not y.contains(x)
+    return False
+
+
+class MapmakerClosureCompiler():
+    CMP_OPS = {
+        'LE': operator.le,
+        'GE': operator.ge,
+        'EQ': operator.eq,
+        'NE': operator.ne,
+        'LT': operator.lt,
+        'GT': operator.gt,
+        'IN': _op_in,
+        'NI': _op_ni,
+    }
+
+    def compile(self, ast):
+        op, *args = ast
+        return getattr(self, op)(*args)
+
+    def _binary(self, func, x, y):
+        x = self.compile(x)
+        y = self.compile(y)
+        return lambda ctx: func(x(ctx), y(ctx))
+
+    def op_add(self, x, y):
+        return self._binary(operator.add, x, y)
+
+    def op_sub(self, x, y):
+        return self._binary(operator.sub, x, y)
+
+    def op_mul(self, x, y):
+        return self._binary(operator.mul, x, y)
+
+    def op_div(self, x, y):
+        return self._binary(operator.truediv, x, y)
+
+    def op_uminus(self, x):
+        x = self.compile(x)
+        return lambda ctx: -x(ctx)
+
+    def op_get(self, x, name):
+        x = self.compile(x)
+        return lambda ctx: x(ctx)[name]
+
+    def op_cmp(self, ops, *exprs):
+        funcs = [self.CMP_OPS[op] for op in ops]
+        exprs = [self.compile(expr) for expr in exprs]
+
+        if len(funcs) == 1:
+            func, = funcs
+            x, y = exprs
+            return lambda ctx: func(x(ctx), y(ctx))
+
+        def cmp(ctx):
+            vals = [expr(ctx) for expr in exprs]
+            result = True
+            for i, func in enumerate(funcs):
+                result = result and func(vals[i], vals[i+1])
+            return result
+
+        return cmp
+
+    def op_and(self, x, y):
+        x = self.compile(x)
+        y = self.compile(y)
+        return lambda ctx: x(ctx) and y(ctx)
+
+    def op_or(self, x, y):
+        x = self.compile(x)
+        y = self.compile(y)
+        return lambda ctx: x(ctx) or y(ctx)
+
+    def op_not(self, x):
+        x = self.compile(x)
+        return lambda ctx: not x(ctx)
+
+    def op_const(self, value):
+        return lambda ctx: value
+
+    def op_getname(self, name):
+        return lambda ctx: ctx[name]
+
+
+def _compile_vm(ast):
     asm = MapmakerAssembler().assemble(ast)
     return MapmakerEval(asm).eval
 
 
+def _compile_closure(ast):
+    return MapmakerClosureCompiler().compile(ast)
+
+
+BACKENDS = {
+    'vm': _compile_vm,
+    'closure': _compile_closure,
+}
+
+
+def mapmaker_parse(text):
+    tokens = MapmakerLexer().tokenize(text)
+    return MapmakerParser().parse(tokens)
+
+
+def mapmaker_compile_ast(ast, backend='closure'):
+    return BACKENDS[backend](ast)
+
+
+def mapmaker_compile(text, backend='closure'):
+    return mapmaker_compile_ast(mapmaker_parse(text), backend)
+
+
 if __name__ == '__main__':
     lexer = MapmakerLexer()
     parser = MapmakerParser()
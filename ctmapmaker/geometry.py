@@ -0,0 +1,99 @@
+import functools
+import math
+
+import numpy as np
+
+from ctmapmaker.coords import TILECOORDS
+
+HEXSIZE = 32
+
+
+def HexagonGenerator(edge_length, offsetx=0, offsety=0):
+    col_width = edge_length * 3
+    row_height = math.sin(math.pi / 3) * edge_length
+
+    def gen(row, col):
+        vertices = []
+        x = (col + 0.5 * (row % 2)) * col_width
+        y = row * row_height
+        for angle in range(0, 360, 60):
+            x += math.cos(math.radians(angle)) * edge_length
+            y += math.sin(math.radians(angle)) * edge_length
+            vertices.append(x + offsetx)
+            vertices.append(y + offsety)
+
+        center = (
+            x + edge_length / 2 + offsetx,
+            y + math.sin(math.radians(60)) * edge_length + offsety
+        )
+        return center, vertices
+
+    return gen
+
+
+def tilecoord2gencoord(coord, pov):
+    tilex, tiley = coord
+    if pov == 0:
+        return tiley, -tilex // 2
+    elif pov == 1:
+        return (
+            (tilex * 3 + tiley) // 2,
+            (-tilex + tiley) // 4
+        )
+    elif pov == 2:
+        return (
+            (tilex * 3 - tiley) // 2,
+            (tilex + tiley) // 4
+        )
+    elif pov == 3:
+        return -tiley, tilex // 2
+    elif pov == 4:
+        return (
+            (-tilex * 3 - tiley) // 2,
+            (tilex - tiley) // 4
+        )
+    elif pov == 5:
+        return (
+            (-tilex * 3 + tiley) // 2,
+            (-tilex - tiley) // 4
+        )
+
+
+def imagesize(mapsize):
+    imagew = 20 + (3 * mapsize + 2) * HEXSIZE
+    imageh = 18 + (4 * mapsize + 2) * HEXSIZE * math.sin(math.pi / 3)
+    return imagew, imageh
+
+
+class Geometry:
+    def __init__(self, mapsize, pov):
+        imagew, imageh = imagesize(mapsize)
+        offx = imagew/2 - HEXSIZE/2
+        offy = imageh/2 - HEXSIZE * math.sin(math.pi / 3)
+        hexagon_generator = HexagonGenerator(HEXSIZE, offx, offy)
+
+        self.codes = list(TILECOORDS)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+
+        # Both helpers are plain arithmetic, so they project and build
+        # every tile at once when given NumPy columns
+        coords = np.array([TILECOORDS[code] for code in self.codes])
+        rows, cols = tilecoord2gencoord(coords.T, pov)
+        center, vertices = hexagon_generator(rows, cols)
+        self.centers = np.stack(center, axis=1)
+        self.vertices = np.stack(vertices, axis=1)
+
+        # aggdraw and PIL take plain sequences
+        self._centers = [tuple(center) for center in self.centers.tolist()]
+        self._vertices = self.vertices.tolist()
+
+    def center(self, tilecode):
+        return self._centers[self.index[tilecode]]
+
+    def hexagon(self, tilecode):
+        return self._vertices[self.index[tilecode]]
+
+
+@functools.cache
+def geometry(mapsize, pov):
+    return Geometry(mapsize, pov)
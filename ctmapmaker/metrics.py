@@ -0,0 +1,158 @@
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+# Set CTMAP_METRICS=0 to turn off timing, Server-Timing and /metrics
+METRICS_ENABLED = os.environ.get('CTMAP_METRICS', '1') != '0'
+
+# Bucket upper bounds, in seconds and in tiles
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                 1, 2.5, 5, 10)
+TILE_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 150, 200)
+
+_timings = contextvars.ContextVar('timings', default=None)
+_untimed = contextlib.nullcontext()
+
+
+class Timings:
+    def __init__(self):
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def totals(self):
+        # A batch runs most stages once per job, report their sum
+        totals = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0) + seconds
+        return totals
+
+    def header(self):
+        return ', '.join(f'{name};dur={seconds * 1000:.2f}'
+                         for name, seconds in self.totals().items())
+
+
+def timed(name):
+    # Only the contextvar lookup when nothing is being timed
+    timings = _timings.get()
+    if timings is None:
+        return _untimed
+    return timings.stage(name)
+
+
+def start():
+    return _timings.set(Timings()) if METRICS_ENABLED else None
+
+
+def finish(token):
+    if token is not None:
+        _timings.reset(token)
+
+
+def current():
+    return _timings.get()
+
+
+def record(stages):
+    # Stages measured in a worker process, added to this request
+    timings = _timings.get()
+    if timings is not None:
+        timings.stages.extend(stages)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name, labels=''):
+        sep = ',' if labels else ''
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}'
+        labels = f'{{{labels}}}' if labels else ''
+        yield f'{name}_sum{labels} {self.sum}'
+        yield f'{name}_count{labels} {self.count}'
+
+
+_lock = threading.Lock()
+STAGES = {}
+SELECTED = Histogram(TILE_BUCKETS)
+ERRORS = {'mapmaker': 0, 'other': 0}
+REQUESTS = {}
+
+
+def observe_request(endpoint, status, timings):
+    with _lock:
+        key = endpoint, status
+        REQUESTS[key] = REQUESTS.get(key, 0) + 1
+        for name, seconds in timings.stages:
+            if name not in STAGES:
+                STAGES[name] = Histogram(STAGE_BUCKETS)
+            STAGES[name].observe(seconds)
+
+
+def observe_selected(count):
+    if METRICS_ENABLED:
+        with _lock:
+            SELECTED.observe(count)
+
+
+def count_error(kind):
+    if METRICS_ENABLED:
+        with _lock:
+            ERRORS[kind] += 1
+
+
+def exposition(caches):
+    # Prometheus text format
+    lines = []
+    with _lock:
+        lines.append('# TYPE ctmapmaker_requests_total counter')
+        for (endpoint, status), count in sorted(REQUESTS.items()):
+            lines.append(f'ctmapmaker_requests_total{{endpoint="{endpoint}",'
+                         f'status="{status}"}} {count}')
+
+        lines.append('# TYPE ctmapmaker_stage_seconds histogram')
+        for name, histogram in sorted(STAGES.items()):
+            lines.extend(histogram.lines(
+                'ctmapmaker_stage_seconds', f'stage="{name}"'))
+
+        lines.append('# TYPE ctmapmaker_selected_tiles histogram')
+        lines.extend(SELECTED.lines('ctmapmaker_selected_tiles'))
+
+        lines.append('# TYPE ctmapmaker_errors_total counter')
+        for kind, count in ERRORS.items():
+            lines.append(f'ctmapmaker_errors_total{{kind="{kind}"}} {count}')
+
+    for field, kind in (('hits', 'counter'), ('misses', 'counter'),
+                        ('evictions', 'counter'), ('size', 'gauge'),
+                        ('weight', 'gauge')):
+        name = f'ctmapmaker_cache_{field}'
+        if kind == 'counter':
+            name += '_total'
+        lines.append(f'# TYPE {name} {kind}')
+        for cache, stats in caches.items():
+            lines.append(f'{name}{{cache="{cache}"}} {stats[field]}')
+
+    return '\n'.join(lines) + '\n'
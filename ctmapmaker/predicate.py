@@ -1,13 +1,15 @@
-import difflib
+import fnmatch
 import functools
 import math
-import yaml
+import re
+from types import MappingProxyType
 
+from ctmapmaker.cache import LRUCache
+from ctmapmaker.config import conf, current, derived
 from ctmapmaker.coords import TILECOORDS
-from ctmapmaker.eval import mapmaker_compile
-
-with open('/ctmapgen-data/conf/conf.yaml', 'r') as f:
-    conf = yaml.safe_load(f)
+from ctmapmaker.error import MapmakerError
+from ctmapmaker.eval import mapmaker_compile_ast, mapmaker_parse
+from ctmapmaker.suggest import SuggestionIndex
 
 ALIASES = {
     'monkeymeadow': 'tutorial',
@@ -154,15 +156,7 @@ class TowerCategory:
 
     def __getitem__(self, name):
         if name == 'count':
-            sum = 0
-            towers_category = conf['towers'][self.category.lower()]
-            for tower in self.tile['GameData']['dcModel']['towers']['_items']:
-                if tower['tower'] in towers_category:
-                    count = tower['max']
-                    if count < 0:
-                        count = math.inf
-                    sum += count
-            return sum
+            return self.tile['Roster'].categories[self.category]
         raise AttributeError(name)
 
     def __bool__(self):
@@ -199,7 +193,7 @@ class TowerCategory:
 class Tower:
     @staticmethod
     def validlist():
-        return conf['towers']['regular']
+        return conf()['towers']['regular']
 
     def __init__(self, tile, tower):
         self.tile = tile
@@ -207,18 +201,11 @@ class Tower:
 
     def __getitem__(self, name):
         if name == 'category':
-            for category in TowerCategory.validlist():
-                if self.tower in conf['towers'][category.lower()]:
-                    return TowerCategory(self.tile, category)
-            assert False
+            categories = conf_index().tower_categories.get(self.tower)
+            assert categories
+            return TowerCategory(self.tile, categories[0])
         if name == 'count':
-            for tower in self.tile['GameData']['dcModel']['towers']['_items']:
-                if tower['tower'] == self.tower:
-                    count = tower['max']
-                    if count < 0:
-                        count = math.inf
-                    return count
-            return 0
+            return self.tile['Roster'].counts.get(self.tower, 0)
         raise AttributeError(name)
 
     def __bool__(self):
@@ -257,7 +244,7 @@ class Tower:
 class Hero:
     @staticmethod
     def validlist():
-        return conf['towers']['hero']
+        return conf()['towers']['hero']
 
     def __init__(self, tile, hero):
         self.tile = tile
@@ -265,14 +252,8 @@ class Hero:
 
     def __getitem__(self, name):
         if name == 'enabled':
-            for tower in self.tile['GameData']['dcModel']['towers']['_items']:
-                if tower['tower'] == 'ChosenPrimaryHero':
-                    if tower['max']:
-                        return True
-                if tower['tower'] == self.hero:
-                    if tower['max']:
-                        return True
-            return False
+            enabled = self.tile['Roster'].enabled
+            return 'ChosenPrimaryHero' in enabled or self.hero in enabled
         raise AttributeError(name)
 
     def __bool__(self):
@@ -292,8 +273,7 @@ class HeroSet:
         self.heros = heros
 
     def __getitem__(self, name):
-        name = name.lower().replace('_', '')
-        name = ALIASES.get(name, name)
+        name = canonical_name(name)
 
         for hero in Hero.validlist():
             if hero.lower() == name:
@@ -302,19 +282,7 @@ class HeroSet:
 
     @classmethod
     def of(cls, tile):
-        allheros = set()
-        heros = set()
-
-        for tower in tile['GameData']['dcModel']['towers']['_items']:
-            if tower['tower'] == 'ChosenPrimaryHero':
-                if tower['max']:
-                    heros = allheros
-            elif tower['isHero']:
-                allheros.add(tower['tower'])
-                if tower['max']:
-                    heros.add(tower['tower'])
-
-        return cls(tile, heros)
+        return cls(tile, tile['Roster'].heros)
 
     def __bool__(self):
         return bool(self.heros)
@@ -362,6 +330,43 @@ class HeroSet:
         return False
 
 
+class Roster:
+    @classmethod
+    def of(cls, tile):
+        return cls(tile['GameData']['dcModel']['towers']['_items'])
+
+    def __init__(self, towers):
+        counts = {}
+        categories = dict.fromkeys(TowerCategory.validlist(), 0)
+        enabled = set()
+        allheros = set()
+        heros = set()
+
+        for tower in towers:
+            count = tower['max']
+            if count < 0:
+                count = math.inf
+            counts.setdefault(tower['tower'], count)
+            for category in conf_index().tower_categories.get(
+                    tower['tower'], ()):
+                categories[category] += count
+            if tower['max']:
+                enabled.add(tower['tower'])
+
+            if tower['tower'] == 'ChosenPrimaryHero':
+                if tower['max']:
+                    heros = allheros
+            elif tower['isHero']:
+                allheros.add(tower['tower'])
+                if tower['max']:
+                    heros.add(tower['tower'])
+
+        self.counts = MappingProxyType(counts)
+        self.categories = MappingProxyType(categories)
+        self.enabled = frozenset(enabled)
+        self.heros = frozenset(heros)
+
+
 @functools.total_ordering
 class MapDifficulty:
     @staticmethod
@@ -384,15 +389,15 @@ class MapDifficulty:
         return NotImplemented
 
     def __bool__(self):
-        return self == Map(self.tile, self.tile['GameData']['selectedMap'])[
-                'difficulty']
+        return self.difficultyidx == conf_index().map_difficulty[
+            self.tile['GameData']['selectedMap']]
 
 
 class Map:
     @staticmethod
-    @functools.cache
+    @derived
     def validlist():
-        return [map['id'] for map in conf['maps']]
+        return [map['id'] for map in conf()['maps']]
 
     @classmethod
     def of(cls, tile):
@@ -404,12 +409,8 @@ class Map:
 
     def __getitem__(self, name):
         if name == 'difficulty':
-            for map in conf['maps']:
-                if map['id'] == self.map:
-                    return MapDifficulty(
-                        self.tile, MapDifficulty.validlist()[
-                            map['difficulty']])
-            assert False
+            return MapDifficulty(self.tile, MapDifficulty.validlist()[
+                conf_index().map_difficulty[self.map]])
         raise AttributeError(name)
 
     def __eq__(self, other):
@@ -547,7 +548,7 @@ class TileType:
 class RelicType:
     @classmethod
     def validlist(cls):
-        return conf['relics']
+        return conf()['relics']
 
     @classmethod
     def of(cls, tile):
@@ -635,9 +636,7 @@ TYPES = [
     RelicType,
     TileCode,
 ]
-ALL_VALIDLIST = [
-    *ALIASES,
-    *CONSTANTS,
+NAMES = [
     'lclt',
     'ltlc',
     'startcash',
@@ -653,16 +652,90 @@ ALL_VALIDLIST = [
     'boss',
     'tiletype',
     'relictype',
+    'tilecode',
     'spawn',
 ]
 
-for cls in TYPES:
-    if cls == TileCode:
-        # too many matches, no point in suggesting
-        continue
 
-    for entry in cls.validlist():
-        ALL_VALIDLIST.append(entry.lower())
+@derived
+def all_validlist():
+    validlist = [
+        *ALIASES,
+        *CONSTANTS,
+        *(name for name in NAMES if name != 'tilecode'),
+    ]
+
+    for cls in TYPES:
+        if cls == TileCode:
+            # too many matches, no point in suggesting
+            continue
+
+        for entry in cls.validlist():
+            validlist.append(entry.lower())
+
+    return validlist
+
+
+class ConfIndex:
+    def __init__(self, conf):
+        self.map_difficulty = MappingProxyType(
+            {map['id']: map['difficulty'] for map in conf['maps']})
+
+        tower_categories = {}
+        for category in TowerCategory.validlist():
+            for tower in conf['towers'][category.lower()]:
+                tower_categories.setdefault(tower, []).append(category)
+        self.tower_categories = MappingProxyType(
+            {tower: tuple(categories)
+             for tower, categories in tower_categories.items()})
+
+        # The first type to list a name wins, as in the old scan
+        names = {}
+        for cls in TYPES:
+            for entry in cls.validlist():
+                names.setdefault(entry.lower(), (cls, entry))
+        self.names = MappingProxyType(names)
+
+
+@derived
+def conf_index():
+    return ConfIndex(conf())
+
+
+@derived
+def suggestion_index():
+    return SuggestionIndex(all_validlist())
+
+
+@derived
+def known_names():
+    return frozenset({*CONSTANTS, *NAMES, *conf_index().names})
+
+
+def unknown_name(name):
+    closest = suggestion_index().close_matches(name)
+    if closest:
+        return NameError(f'{name}. Did you mean: {", ".join(closest)}')
+    return NameError(name)
+
+
+def check_names(ast):
+    # Report unknown names once per query instead of on the first tile
+    op, *args = ast
+    if op == 'op_getname':
+        name = canonical_name(args[0])
+        if name not in known_names():
+            raise unknown_name(name)
+        return
+
+    for arg in args:
+        if isinstance(arg, tuple):
+            check_names(arg)
+
+
+def canonical_name(name):
+    name = name.lower().replace('_', '')
+    return ALIASES.get(name, name)
 
 
 class Context:
@@ -670,8 +743,7 @@ class Context:
         self.tile = tile
 
     def __getitem__(self, name):
-        name = name.lower().replace('_', '')
-        name = ALIASES.get(name, name)
+        name = canonical_name(name)
         if name in CONSTANTS:
             return CONSTANTS[name]
 
@@ -717,27 +789,84 @@ class Context:
         if name == 'spawn':
             return spawn_of(self.tile)
 
-        for cls in TYPES:
-            for entry in cls.validlist():
-                if name == entry.lower():
-                    return cls(self.tile, entry)
+        if name in conf_index().names:
+            cls, entry = conf_index().names[name]
+            return cls(self.tile, entry)
+
+        raise unknown_name(name)
+
+
+class Predicate:
+    def __init__(self, func, ast=None, codes=None):
+        self.func = func
+        self.ast = ast
+        # The selected tile codes, when known without looking at tiles
+        self.codes = codes
+
+    def __call__(self, tile):
+        return self.func(tile)
+
+
+PREDICATE_CACHE = LRUCache(1024)
+
 
-        closest = difflib.get_close_matches(name, ALL_VALIDLIST)
-        if closest:
-            raise NameError(f'{name}. Did you mean: {", ".join(closest)}')
-        raise NameError(name)
+def normalize_predicate(predicate_str):
+    return re.sub(r'[ \t]+', ' ', predicate_str).strip(' \t')
 
 
 def make_predicate(predicate_str):
+    key = normalize_predicate(predicate_str)
+    # Names resolve against the conf, a new one compiles afresh
+    cachekey = (current().version, key)
+    predicate = PREDICATE_CACHE.get(cachekey)
+    if predicate is None:
+        try:
+            predicate = _make_predicate(key)
+        except (MapmakerError, NameError) as e:
+            # Cache the rejection too, so a repeatedly pasted bad query
+            # does not go through the parser again
+            predicate = e
+        PREDICATE_CACHE.put(cachekey, predicate)
+
+    if isinstance(predicate, Exception):
+        raise type(predicate)(*predicate.args)
+    return predicate
+
+
+def tile_list(predicate_str):
+    # Codes may be patterns such as AA* or B?A. A single pattern without
+    # a comma is only a list if it matches, 'dart*ninja' is arithmetic.
+    items = predicate_str.replace(' ', '').upper().split(',')
+    if len(items) == 1 and not any(c in items[0] for c in '*?'):
+        return None
+
+    codes = set()
+    for item in items:
+        if item in TILECOORDS:
+            codes.add(item)
+            continue
+
+        if any(c in item for c in '*?'):
+            matched = [code for code in TILECOORDS
+                       if fnmatch.fnmatchcase(code, item)]
+            if matched:
+                codes.update(matched)
+                continue
+        return None
+
+    return frozenset(codes)
+
+
+def _make_predicate(predicate_str):
     if not predicate_str.strip():
-        return lambda _: False
+        return Predicate(lambda _: False)
 
     # Special case for a comma-separated list of tiles
-    if ',' in predicate_str:
-        tiles = predicate_str.replace(' ', '').split(',')
-        if all(code.upper() in TILECOORDS for code in tiles):
-            return lambda tile: any(
-                code.upper() == tile['Code'] for code in tiles)
-
-    func = mapmaker_compile(predicate_str)
-    return lambda tile: func(Context(tile))
+    codes = tile_list(predicate_str)
+    if codes is not None:
+        return Predicate(lambda tile: tile['Code'] in codes, codes=codes)
+
+    ast = mapmaker_parse(predicate_str)
+    check_names(ast)
+    func = mapmaker_compile_ast(ast)
+    return Predicate(lambda tile: func(Context(tile)), ast)
@@ -0,0 +1,82 @@
+import os
+import threading
+import traceback
+
+from ctmapmaker.config import reload
+from ctmapmaker.season import load_season, season_keys, season_version
+from ctmapmaker.vector import season_columns
+
+# How many of the newest seasons to keep warm, 0 disables preloading
+PRELOAD_SEASONS = int(os.environ.get('PRELOAD_SEASONS', 2))
+# Seconds between scans of CTMAP_ROOT
+PRELOAD_INTERVAL = float(os.environ.get('PRELOAD_INTERVAL', 10))
+
+
+class Preloader:
+    def __init__(self, count, interval, layers=False):
+        self.count = count
+        self.interval = interval
+        self.layers = layers
+        self.warm = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def warm_season(self, key):
+        # load_season only publishes a season once it is fully built, so
+        # requests keep using the previous version until the swap
+        season = load_season(key)
+        season_columns(season).build()
+        if self.layers:
+            from ctmapmaker.draw import render_season
+            # With a selection first, a missing legend icon only keeps
+            # the legend layers cold
+            for teamid in range(6):
+                render_season(season, tuple(season.tiles)[:1], teamid)
+            for teamid in range(6):
+                render_season(season, (), teamid)
+        return season
+
+    def scan(self):
+        # A changed conf is usually loaded and indexed here, off the
+        # request path, and its new version makes every season below
+        # reload too
+        try:
+            reload()
+        except Exception:
+            traceback.print_exc()
+
+        keys = season_keys()[-self.count:] if self.count else []
+        warm = {}
+        for key in keys:
+            version = season_version(key)
+            if self.warm.get(key) == version:
+                warm[key] = version
+                continue
+
+            try:
+                warm[key] = self.warm_season(key).version
+            except Exception:
+                traceback.print_exc()
+
+        self.warm = warm
+
+    def is_warm(self, key):
+        return self.warm.get(key) == season_version(key)
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.scan()
+            except Exception:
+                traceback.print_exc()
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        if self.count and self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, name='preload', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,79 @@
+import math
+
+from ctmapmaker.error import MapmakerError
+from ctmapmaker.predicate import (
+    Boss, Difficulty, GameType, Hero, HeroSet, Map, MapDifficulty, RelicType,
+    TileCode, TileType, Tower, TowerCategory, canonical_name, make_predicate)
+from ctmapmaker.selection import select_tiles
+
+NAME_ATTRS = {
+    Map: 'map',
+    MapDifficulty: 'difficulty',
+    Difficulty: 'difficulty',
+    GameType: 'gametype',
+    Boss: 'boss',
+    TileType: 'tiletype',
+    RelicType: 'relictype',
+    TileCode: 'code',
+}
+
+# Names that read a value off the tile. Any other bare name is an entry
+# of the conf, such as a map or a game type, and asks whether the tile
+# matches it.
+VALUE_NAMES = frozenset([
+    'map', 'difficulty', 'gametype', 'boss', 'tiletype', 'relictype',
+    'tilecode',
+])
+
+
+def is_entry(predicate):
+    ast = predicate.ast
+    return (ast is not None and ast[0] == 'op_getname' and
+            canonical_name(ast[1]) not in VALUE_NAMES)
+
+
+def jsonable(value, entry=False):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if math.isinf(value):
+            return 'inf' if value > 0 else '-inf'
+        return value
+    if isinstance(value, (Tower, TowerCategory)):
+        return jsonable(value['count'])
+    if isinstance(value, Hero):
+        return value['enabled']
+    if isinstance(value, HeroSet):
+        return sorted(value.heros)
+    if type(value) in NAME_ATTRS:
+        if entry:
+            return bool(value)
+        return getattr(value, NAME_ATTRS[type(value)])
+    return value
+
+
+def query(season, predicate_str, fields=None):
+    if fields is not None and (
+            not isinstance(fields, list) or
+            not all(isinstance(field, str) for field in fields)):
+        raise MapmakerError('Fields must be a list of expressions')
+
+    tiles = select_tiles(season, predicate_str)
+    result = {
+        'tiles': list(tiles),
+        'count': len(tiles),
+    }
+
+    if fields:
+        # Fields are expressions in the predicate language too
+        funcs = {field: make_predicate(field) for field in fields}
+        entries = {field: is_entry(func) for field, func in funcs.items()}
+        result['fields'] = {
+            tilecode: {
+                field: jsonable(func(season.tiles[tilecode]), entries[field])
+                for field, func in funcs.items()
+            }
+            for tilecode in tiles
+        }
+
+    return result
@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+from types import MappingProxyType
+
+from ctmapmaker.cache import LRUCache
+from ctmapmaker.config import current, pinned
+from ctmapmaker.coords import MYRIN_CODEMAP
+from ctmapmaker.error import MapmakerError
+from ctmapmaker.metrics import timed
+from ctmapmaker.predicate import Roster
+
+CTMAP_ROOT = os.environ.get('CTMAP_ROOT', '/ctmap')
+SEASON_FILES = ['tiles.json', 'event_relics.json', 'daily_powers.json']
+
+SEASON_CACHE = LRUCache(8)
+_load_lock = threading.Lock()
+
+
+def freeze(obj):
+    if isinstance(obj, dict):
+        return MappingProxyType({k: freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(freeze(v) for v in obj)
+    return obj
+
+
+class Season:
+    def __init__(self, key, version, path):
+        self.key = key
+        self.version = version
+
+        with open(os.path.join(path, 'tiles.json')) as f:
+            tiles_raw = json.load(f)
+
+        tiles = {}
+        for tilecode, tiledata in tiles_raw.items():
+            tilecode = MYRIN_CODEMAP.get(tilecode, tilecode)
+            tiles[tilecode] = tiledata
+            tiledata['Code'] = tilecode
+
+        if 'AAA' in tiles:
+            self.mapsize = 8
+        elif 'AAB' in tiles:
+            self.mapsize = 7
+        else:
+            self.mapsize = 6
+
+        for tiledata in tiles.values():
+            tiledata['MapSize'] = self.mapsize
+            tiledata['Roster'] = Roster.of(tiledata)
+
+        self.tiles = freeze(tiles)
+        self.event_relics = self._loadmeta(path, 'event_relics.json')
+        self.daily_powers = self._loadmeta(path, 'daily_powers.json')
+
+    @staticmethod
+    def _loadmeta(path, name):
+        try:
+            f = open(os.path.join(path, name))
+        except FileNotFoundError:
+            return ()
+
+        with f:
+            return freeze(json.load(f))
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def season_keys():
+    # Seasons with data under CTMAP_ROOT, oldest first
+    try:
+        names = os.listdir(CTMAP_ROOT)
+    except FileNotFoundError:
+        return []
+
+    names = [name for name in names
+             if os.path.exists(os.path.join(CTMAP_ROOT, name, 'tiles.json'))]
+    return sorted(names, key=lambda name: (not name.isdigit(),
+                                           int(name) if name.isdigit() else 0,
+                                           name))
+
+
+def season_version(key):
+    # Rosters are summed with the conf's categories, so a season is
+    # rebuilt when either changes
+    path = os.path.join(CTMAP_ROOT, key)
+    return (*(_mtime(os.path.join(path, name)) for name in SEASON_FILES),
+            current().version)
+
+
+def load_season(season):
+    with timed('season'), pinned():
+        return _load_season(season)
+
+
+def _load_season(season):
+    key = str(season)
+    path = os.path.join(CTMAP_ROOT, key)
+    version = season_version(key)
+    if version[0] is None:
+        raise MapmakerError("I don't have the challenge data for that event!")
+
+    cached = SEASON_CACHE.get(key)
+    if cached is not None and cached.version == version:
+        return cached
+
+    with _load_lock:
+        # Another request may have loaded it while we waited
+        cached = SEASON_CACHE.get(key)
+        if cached is not None and cached.version == version:
+            return cached
+
+        try:
+            loaded = Season(key, version, path)
+        except FileNotFoundError:
+            raise MapmakerError(
+                "I don't have the challenge data for that event!")
+        SEASON_CACHE.put(key, loaded)
+        return loaded
+
+
+def loadtiles(season):
+    return load_season(season).tiles
@@ -0,0 +1,31 @@
+from ctmapmaker import vector
+from ctmapmaker.cache import LRUCache
+from ctmapmaker.metrics import timed
+from ctmapmaker.predicate import make_predicate, normalize_predicate
+
+# Every team POV of a season selects the same tiles
+SELECTION_CACHE = LRUCache(4096)
+
+
+def evaluate(season, predicate):
+    if predicate.codes is not None:
+        return [tilecode for tilecode in season.tiles
+                if tilecode in predicate.codes]
+
+    selected = vector.select(season, predicate)
+    if selected is None:
+        selected = [tilecode for tilecode, tiledata in season.tiles.items()
+                    if predicate(tiledata)]
+    return selected
+
+
+def select_tiles(season, predicate_str):
+    key = (season.key, season.version, normalize_predicate(predicate_str))
+    selected = SELECTION_CACHE.get(key)
+    if selected is None:
+        with timed('compile'):
+            predicate = make_predicate(predicate_str)
+        with timed('evaluate'):
+            selected = tuple(evaluate(season, predicate))
+        SELECTION_CACHE.put(key, selected)
+    return selected
@@ -1,29 +1,256 @@
+import hashlib
+import json
+import time
 import traceback
+import zipfile
 from io import BytesIO
 
-from flask import Flask, jsonify, request, send_file, make_response
+from flask import Flask, g, jsonify, request, make_response
 
-from ctmapmaker.draw import render
+from ctmapmaker import config, metrics
+from ctmapmaker.cache import LRUCache
+from ctmapmaker.encode import FORMATS, check_format
 from ctmapmaker.error import MapmakerError
+from ctmapmaker.predicate import PREDICATE_CACHE, normalize_predicate
+from ctmapmaker.preload import PRELOAD_INTERVAL, PRELOAD_SEASONS, Preloader
+from ctmapmaker.query import query
+from ctmapmaker.season import SEASON_CACHE, load_season, season_keys
+from ctmapmaker.selection import SELECTION_CACHE
+from ctmapmaker.workers import RENDER_WORKERS, RETRY_AFTER, Overloaded, pool
 
 
 app = Flask(__name__)
 
+# Encoded image and X-Tiles header by ETag, bounded by total image bytes
+RESPONSE_CACHE = LRUCache(64 * 1024 * 1024, weigh=lambda entry: len(entry[0]))
+
+MAX_BATCH_JOBS = 36
+
+# Workers warm their own layers, this process only needs them when it
+# renders by itself
+preloader = Preloader(PRELOAD_SEASONS, PRELOAD_INTERVAL,
+                      layers=not RENDER_WORKERS).start()
+
+
+@app.before_request
+def pin_config():
+    # Pick up an edited conf before this request, whether or not seasons
+    # are being preloaded. A broken conf keeps the previous version.
+    try:
+        config.reload()
+    except Exception:
+        traceback.print_exc()
+    # A conf reload mid-request must not mix versions, the request
+    # finishes on the one it started with
+    g.config_token = config.pin()
+
+
+@app.teardown_request
+def unpin_config(exc):
+    token = g.pop('config_token', None)
+    if token is not None:
+        config.unpin(token)
+
+
+if metrics.METRICS_ENABLED:
+    @app.before_request
+    def start_timing():
+        g.timing_token = metrics.start()
+        g.timing_start = time.perf_counter()
+
+    @app.after_request
+    def report_timing(response):
+        timings = metrics.current()
+        if timings is not None:
+            timings.stages.append(
+                ('total', time.perf_counter() - g.timing_start))
+            response.headers['Server-Timing'] = timings.header()
+            metrics.observe_request(
+                request.endpoint, response.status_code, timings)
+        return response
+
+    @app.teardown_request
+    def finish_timing(exc):
+        metrics.finish(g.pop('timing_token', None))
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        caches = {
+            'response': RESPONSE_CACHE.stats(),
+            'season': SEASON_CACHE.stats(),
+            'predicate': PREDICATE_CACHE.stats(),
+            'selection': SELECTION_CACHE.stats(),
+        }
+        response = make_response(metrics.exposition(caches))
+        response.mimetype = 'text/plain; version=0.0.4'
+        return response
+
+
+def response_etag(season, predicate_str, teamid, format, level):
+    key = (season.key, season.version, normalize_predicate(predicate_str),
+           teamid, format, level)
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+def submit_image(season, predicate_str, teamid, format, level, etag,
+                 block=False):
+    # Returns the cached response, or a future of the worker rendering it
+    cached = RESPONSE_CACHE.get(etag)
+    if cached is not None:
+        return cached, None
+    return None, pool().submit(
+        season.key, season.version, predicate_str, teamid, format, level,
+        block=block)
+
+
+def image_result(etag, cached, future):
+    if cached is None:
+        image, tiles, stages = pool().result(future)
+        metrics.record(stages)
+        cached = image, tiles
+        RESPONSE_CACHE.put(etag, cached)
+    return cached
+
+
+def error_message(e):
+    if isinstance(e, MapmakerError):
+        metrics.count_error('mapmaker')
+        return str(e)
+    metrics.count_error('other')
+    traceback.print_exc()
+    return f'{type(e).__name__}: {e}'
+
+
+def error_response(e):
+    response = jsonify({'error': error_message(e)})
+    if isinstance(e, Overloaded):
+        response.status_code = 503
+        response.headers['Retry-After'] = str(RETRY_AFTER)
+    else:
+        response.status_code = 500
+    return response
+
 
 @app.route('/', methods=['POST'])
 def endpoint():
     data = request.get_json()
     try:
-        img_io = BytesIO()
-        image, tiles = render(data['season'], data['predicate'], data['team'])
-        image.save(img_io, 'PNG')
-        img_io.seek(0)
+        season = load_season(data['season'])
+        format = data.get('format', 'png')
+        level = data.get('compress_level')
+        # Reject bad options before rendering anything
+        check_format(format, level)
+        etag = response_etag(
+            season, data['predicate'], data['team'], format, level)
+        if etag in request.if_none_match:
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
 
-        response = make_response(send_file(img_io, mimetype='image/png'))
-        response.headers['X-Tiles'] = ','.join(tiles)
+        cached, future = submit_image(
+            season, data['predicate'], data['team'], format, level, etag)
+        image, tiles = image_result(etag, cached, future)
+        metrics.observe_selected(tiles.count(',') + 1 if tiles else 0)
+        response = make_response(image)
+        response.mimetype = FORMATS[format][0]
+        response.headers['X-Tiles'] = tiles
+        response.set_etag(etag)
         return response
-    except MapmakerError as e:
-        return jsonify({'error': str(e)}), 500
     except Exception as e:
-        traceback.print_exc()
-        return jsonify({'error': f'{type(e).__name__}: {e}'}), 500
+        return error_response(e)
+
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    data = request.get_json()
+    try:
+        jobs = data['jobs']
+        if len(jobs) > MAX_BATCH_JOBS:
+            raise MapmakerError(
+                f'Too many jobs in one batch, the limit is {MAX_BATCH_JOBS}')
+
+        # Load the season once, so every job sees the same version
+        season = load_season(data['season'])
+        manifest = []
+        pending = []
+        zip_io = BytesIO()
+
+        # Hand every job to the workers first so they render in parallel.
+        # A batch waits for queue slots instead of being turned away.
+        for job in jobs:
+            entry = {}
+            try:
+                if not isinstance(job, dict):
+                    raise MapmakerError('Every job must be an object')
+                entry.update(predicate=job.get('predicate'),
+                             team=job.get('team'))
+                if entry['predicate'] is None or entry['team'] is None:
+                    raise MapmakerError(
+                        'Every job needs a predicate and a team')
+                format = job.get('format', data.get('format', 'png'))
+                level = job.get('compress_level', data.get('compress_level'))
+                check_format(format, level)
+                etag = response_etag(
+                    season, job['predicate'], job['team'], format, level)
+                pending.append((entry, format, etag, *submit_image(
+                    season, job['predicate'], job['team'], format, level,
+                    etag, block=True)))
+            except Exception as e:
+                entry['error'] = error_message(e)
+                pending.append((entry, None, None, None, None))
+
+        # Images are already compressed, store them as is
+        with zipfile.ZipFile(zip_io, 'w', zipfile.ZIP_STORED) as zf:
+            for i, (entry, format, etag, cached, future) in enumerate(pending):
+                if etag is None:
+                    manifest.append(entry)
+                    continue
+                try:
+                    image, tiles = image_result(etag, cached, future)
+                except Exception as e:
+                    entry['error'] = error_message(e)
+                else:
+                    entry['file'] = f'{i}.{FORMATS[format][1]}'
+                    entry['tiles'] = tiles.split(',') if tiles else []
+                    metrics.observe_selected(len(entry['tiles']))
+                    zf.writestr(entry['file'], image)
+                manifest.append(entry)
+
+            zf.writestr('manifest.json', json.dumps(manifest))
+
+        response = make_response(zip_io.getvalue())
+        response.mimetype = 'application/zip'
+        return response
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/tiles', methods=['POST'])
+def tiles_endpoint():
+    data = request.get_json()
+    try:
+        season = load_season(data['season'])
+        result = query(season, data['predicate'], data.get('fields'))
+        metrics.observe_selected(result['count'])
+        return jsonify(result)
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/reload', methods=['POST'])
+def reload_endpoint():
+    try:
+        return jsonify({'conf_version': config.reload(force=True).version})
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/seasons', methods=['GET'])
+def seasons_endpoint():
+    return jsonify({
+        'conf_version': config.current().version,
+        'seasons': [
+            {'season': key, 'warm': preloader.is_warm(key)}
+            for key in season_keys()
+        ],
+    })
@@ -0,0 +1,44 @@
+import collections
+import difflib
+import heapq
+
+
+def _letters(word):
+    # Each letter tagged with its occurrence count, so the postings a
+    # query shares with a word count their common letters as a multiset
+    seen = collections.Counter()
+    for letter in word:
+        seen[letter] += 1
+        yield letter, seen[letter]
+
+
+class SuggestionIndex:
+    # Gives the same results as difflib.get_close_matches. Shared letters
+    # bound difflib's quick_ratio, so only words that can still reach the
+    # cutoff are passed to the full SequenceMatcher.
+    def __init__(self, words):
+        self.words = list(words)
+        self.postings = collections.defaultdict(list)
+        for i, word in enumerate(self.words):
+            for letter in _letters(word):
+                self.postings[letter].append(i)
+
+    def close_matches(self, word, n=3, cutoff=0.6):
+        shared = collections.Counter()
+        for letter in _letters(word):
+            shared.update(self.postings.get(letter, ()))
+
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(word)
+        result = []
+        for i, common in shared.items():
+            candidate = self.words[i]
+            if 2 * common / (len(word) + len(candidate)) < cutoff:
+                continue
+
+            matcher.set_seq1(candidate)
+            if (matcher.real_quick_ratio() >= cutoff and
+                    matcher.ratio() >= cutoff):
+                result.append((matcher.ratio(), candidate))
+
+        return [candidate for score, candidate in heapq.nlargest(n, result)]
@@ -0,0 +1,317 @@
+import operator
+
+import numpy as np
+
+from ctmapmaker.cache import LRUCache
+from ctmapmaker.error import MapmakerError
+from ctmapmaker.predicate import (
+    CONSTANTS, Boss, Context, Difficulty, GameType, Map, Tower, TowerCategory,
+    canonical_name, conf_index)
+
+NUMERIC = ('int', 'float')
+
+NUMERIC_NAMES = {
+    'startcash': 'int',
+    'startround': 'int',
+    'endround': 'float',
+    'bosstiers': 'int',
+    'towerlimit': 'float',
+    'maxtowers': 'float',
+    'spawn': 'int',
+}
+
+OBJECT_NAMES = [
+    'lclt',
+    'ltlc',
+    'hero',
+    'map',
+    'difficulty',
+    'gametype',
+    'boss',
+    'tiletype',
+    'relictype',
+    'tilecode',
+]
+
+
+class Unsupported(Exception):
+    pass
+
+
+class SeasonColumns:
+    def __init__(self, season):
+        self.codes = list(season.tiles)
+        self.tiles = list(season.tiles.values())
+        self.columns = {}
+
+    def column(self, key, func, dtype=float):
+        column = self.columns.get(key)
+        if column is None:
+            column = np.array([func(tile) for tile in self.tiles], dtype=dtype)
+            self.columns[key] = column
+        return column
+
+    def gamedata(self, field, dtype=float):
+        return self.column(
+            field, lambda tile: tile['GameData'][field], dtype)
+
+    def bossdata(self, field, default):
+        def get(tile):
+            if 'bossData' not in tile['GameData']:
+                return default
+            return tile['GameData']['bossData'][field]
+
+        return self.column(field, get)
+
+    def named(self, name):
+        return self.column(name, lambda tile: Context(tile)[name])
+
+    def truth(self, key, func):
+        return self.column(key, lambda tile: bool(func(tile)), bool)
+
+    def build(self):
+        # The columns most predicates read, for building ahead of time.
+        # Tower counts and other entries are still filled on first use.
+        for name in NUMERIC_NAMES:
+            self.named(name)
+        self.gamedata('selectedMap', str)
+        self.gamedata('selectedDifficulty', str)
+        self.gamedata('subGameType')
+        self.bossdata('bossBloon', -1)
+        return self
+
+
+def _num(value):
+    # numpy adds bools as a logical or and refuses to subtract them,
+    # Python adds bools as ints. This covers arrays, numpy scalars from
+    # op_not on a constant, and the true/false constants. Other scalars
+    # stay Python numbers, so constant arithmetic does not wrap at 64 bits.
+    if isinstance(value, np.ndarray):
+        return value.astype(int) if value.dtype == bool else value
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    return value
+
+
+def _exact(func, x, y):
+    # Int arrays wrap around and float arrays round where Python ints stay
+    # exact, leave results that large to the scalar path
+    result = func(x, y)
+    if isinstance(result, np.ndarray):
+        approx = result
+        if result.dtype.kind != 'f':
+            approx = func(np.asarray(x, float), np.asarray(y, float))
+        approx = np.abs(approx[np.isfinite(approx)])
+        if np.any(approx >= 2.0 ** 53):
+            raise Unsupported('inexact result')
+    return result
+
+
+def _truthy(kind, value):
+    if kind == 'truth':
+        return value
+    return _num(value) != 0
+
+
+def _numkind(xkind, ykind):
+    if xkind not in NUMERIC or ykind not in NUMERIC:
+        raise Unsupported(xkind, ykind)
+    return 'int' if xkind == ykind == 'int' else 'float'
+
+
+def _comparable(xkind, ykind):
+    # Tower and TowerCategory only compare their count against ints
+    if xkind in NUMERIC and ykind in NUMERIC:
+        return True
+    return {xkind, ykind} == {'count', 'int'}
+
+
+class VectorCompiler():
+    CMP_OPS = {
+        'LE': operator.le,
+        'GE': operator.ge,
+        'EQ': operator.eq,
+        'NE': operator.ne,
+        'LT': operator.lt,
+        'GT': operator.gt,
+    }
+
+    def compile(self, ast):
+        op, *args = ast
+        method = getattr(self, op, None)
+        if method is None:
+            raise Unsupported(op)
+        return method(*args)
+
+    def _arith(self, func, x, y):
+        xkind, x = self.compile(x)
+        ykind, y = self.compile(y)
+        kind = _numkind(xkind, ykind)
+        return kind, lambda cols: _exact(func, _num(x(cols)), _num(y(cols)))
+
+    def op_add(self, x, y):
+        return self._arith(operator.add, x, y)
+
+    def op_sub(self, x, y):
+        return self._arith(operator.sub, x, y)
+
+    def op_mul(self, x, y):
+        return self._arith(operator.mul, x, y)
+
+    def op_div(self, x, y):
+        xkind, x = self.compile(x)
+        ykind, y = self.compile(y)
+        _numkind(xkind, ykind)
+
+        def div(cols):
+            divisor = _num(y(cols))
+            if np.any(divisor == 0):
+                # Leave the ZeroDivisionError to the scalar path
+                raise Unsupported('division by zero')
+            return _exact(operator.truediv, _num(x(cols)), divisor)
+
+        return 'float', div
+
+    def op_uminus(self, x):
+        kind, x = self.compile(x)
+        _numkind(kind, kind)
+        return kind, lambda cols: -_num(x(cols))
+
+    def op_get(self, x, name):
+        kind, x = self.compile(x)
+        if kind == 'count' and name == 'count':
+            return 'float', x
+        raise Unsupported(kind, name)
+
+    def op_cmp(self, ops, *exprs):
+        if not all(op in self.CMP_OPS for op in ops):
+            raise Unsupported(ops)
+        funcs = [self.CMP_OPS[op] for op in ops]
+        kinds, exprs = zip(*(self.compile(expr) for expr in exprs))
+        for i in range(len(funcs)):
+            if not _comparable(kinds[i], kinds[i+1]):
+                raise Unsupported(kinds[i], kinds[i+1])
+
+        def cmp(cols):
+            vals = [_num(expr(cols)) for expr in exprs]
+            result = True
+            for i, func in enumerate(funcs):
+                result = result & func(vals[i], vals[i+1])
+            return result
+
+        return 'int', cmp
+
+    def op_and(self, x, y):
+        xkind, x = self.compile(x)
+        ykind, y = self.compile(y)
+        if xkind in NUMERIC and ykind in NUMERIC:
+            def and_(cols):
+                xval = x(cols)
+                return np.where(_truthy(xkind, xval), y(cols), xval)
+            return _numkind(xkind, ykind), and_
+
+        return 'truth', lambda cols: (
+            _truthy(xkind, x(cols)) & _truthy(ykind, y(cols)))
+
+    def op_or(self, x, y):
+        xkind, x = self.compile(x)
+        ykind, y = self.compile(y)
+        if xkind in NUMERIC and ykind in NUMERIC:
+            def or_(cols):
+                xval = x(cols)
+                return np.where(_truthy(xkind, xval), xval, y(cols))
+            return _numkind(xkind, ykind), or_
+
+        return 'truth', lambda cols: (
+            _truthy(xkind, x(cols)) | _truthy(ykind, y(cols)))
+
+    def op_not(self, x):
+        kind, x = self.compile(x)
+        return 'int', lambda cols: np.logical_not(_truthy(kind, x(cols)))
+
+    def op_const(self, value):
+        return 'int', lambda cols: value
+
+    def op_getname(self, name):
+        # Resolve in the same order as Context.__getitem__
+        name = canonical_name(name)
+        if name in CONSTANTS:
+            value = CONSTANTS[name]
+            kind = 'float' if isinstance(value, float) else 'int'
+            return kind, lambda cols: value
+
+        if name in NUMERIC_NAMES:
+            return NUMERIC_NAMES[name], lambda cols: cols.named(name)
+        if name in OBJECT_NAMES:
+            return 'truth', lambda cols: cols.truth(
+                name, lambda tile: Context(tile)[name])
+
+        if name in conf_index().names:
+            return self._entry(*conf_index().names[name])
+
+        # Unknown names raise from the scalar path, with suggestions
+        raise Unsupported(name)
+
+    def _entry(self, cls, entry):
+        if cls is Tower or cls is TowerCategory:
+            return 'count', lambda cols: cols.column(
+                (cls, entry), lambda tile: cls(tile, entry)['count'])
+        if cls is Map:
+            return 'truth', lambda cols: (
+                cols.gamedata('selectedMap', str) == entry)
+        if cls is Difficulty:
+            return 'truth', lambda cols: (
+                cols.gamedata('selectedDifficulty', str) == entry)
+        if cls is GameType:
+            num = GameType.GAMEMODEMAP[entry]
+            return 'truth', lambda cols: cols.gamedata('subGameType') == num
+        if cls is Boss:
+            num = Boss.validlist().index(entry)
+            return 'truth', lambda cols: cols.bossdata('bossBloon', -1) == num
+
+        return 'truth', lambda cols: cols.truth(
+            (cls, entry), lambda tile: cls(tile, entry))
+
+
+_programs = LRUCache(1024)
+_columns = LRUCache(8)
+
+
+def season_columns(season):
+    columns = _columns.get(season)
+    if columns is None:
+        columns = SeasonColumns(season)
+        _columns.put(season, columns)
+    return columns
+
+
+def select(season, predicate):
+    if predicate.ast is None:
+        return None
+
+    program = _programs.get(predicate)
+    if program is None:
+        try:
+            program = VectorCompiler().compile(predicate.ast)
+        except Unsupported:
+            program = False
+        _programs.put(predicate, program)
+    if not program:
+        return None
+
+    kind, func = program
+    columns = season_columns(season)
+    try:
+        # Float overflow falls back too, the scalar path decides between
+        # inf and an OverflowError
+        with np.errstate(all='ignore', over='raise'):
+            mask = _truthy(kind, func(columns))
+    except MapmakerError:
+        raise
+    except Exception:
+        # Anything the engine cannot do, the scalar path answers, and
+        # raises the user's error if there is one
+        return None
+
+    mask = np.broadcast_to(mask, len(columns.codes))
+    return [code for code, selected in zip(columns.codes, mask) if selected]
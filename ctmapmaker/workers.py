@@ -0,0 +1,177 @@
+import concurrent.futures
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+from ctmapmaker.config import at_version, pinned
+from ctmapmaker.encode import encode
+from ctmapmaker import metrics
+from ctmapmaker.error import MapmakerError
+from ctmapmaker.preload import PRELOAD_INTERVAL, PRELOAD_SEASONS, Preloader
+from ctmapmaker.season import load_season
+from ctmapmaker.selection import select_tiles
+
+# 0 renders on the request thread, as before the pool existed
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 1))
+# Jobs that may wait for a free worker before requests are turned away
+RENDER_QUEUE = int(os.environ.get('RENDER_QUEUE', max(RENDER_WORKERS, 1) * 2))
+RENDER_TIMEOUT = float(os.environ.get('RENDER_TIMEOUT', 30))
+RETRY_AFTER = int(os.environ.get('RENDER_RETRY_AFTER', 1))
+
+
+class Overloaded(MapmakerError):
+    pass
+
+
+class RenderTimeout(MapmakerError):
+    pass
+
+
+def _alarm(signum, frame):
+    raise RenderTimeout('Rendering took too long')
+
+
+def _init(timeout):
+    if timeout:
+        signal.signal(signal.SIGALRM, _alarm)
+
+    # Build the season, layer and sprite caches of this process before
+    # the first real job arrives, and keep them current afterwards
+    preloader = Preloader(PRELOAD_SEASONS, PRELOAD_INTERVAL, layers=True)
+    preloader.scan()
+    preloader.start()
+
+
+def render_job(key, version, predicate_str, teamid, format, level,
+               timeout=None):
+    # The server process only needs aggdraw when it renders by itself
+    from ctmapmaker.draw import render_season
+
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    # Stages are timed here and sent back, the server process keeps the
+    # metrics
+    token = metrics.start()
+    try:
+        # The server keys its ETag and response cache by the version it
+        # loaded, the image must be rendered from that same version. The
+        # conf version is the last part of the season version.
+        config = at_version(version[-1])
+        if config is None:
+            raise MapmakerError(
+                'The challenge data changed while rendering, try again')
+        with pinned(config):
+            season = load_season(key)
+            if season.version != version:
+                raise MapmakerError(
+                    'The challenge data changed while rendering, try again')
+            tiles = select_tiles(season, predicate_str)
+            image = render_season(season, tiles, teamid)
+        with metrics.timed('encode'):
+            data = encode(image, format, level)
+        timings = metrics.current()
+        # The server times its own season load, keep this one apart
+        stages = [('worker_season' if name == 'season' else name, seconds)
+                  for name, seconds in (timings.stages if timings else [])]
+        return data, ','.join(tiles), stages
+    finally:
+        metrics.finish(token)
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class RenderPool:
+    def __init__(self, workers, queue, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max(workers, 1) + queue)
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                # Forking a threaded server is unsafe, start clean
+                # processes instead
+                self.executor = concurrent.futures.ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init,
+                    initargs=(self.timeout,))
+            return self.executor
+
+    def _reset(self, executor):
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, *job, block=False):
+        if block:
+            acquired = self.slots.acquire(timeout=self.timeout)
+        else:
+            acquired = self.slots.acquire(blocking=False)
+        if not acquired:
+            raise Overloaded('Too many maps are being rendered, try again '
+                             'in a moment')
+
+        try:
+            if not self.workers:
+                future = concurrent.futures.Future()
+                try:
+                    # The render happens right here, not while waiting for
+                    # the result
+                    with metrics.timed('render'):
+                        future.set_result(render_job(*job))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                executor = self._executor()
+                try:
+                    future = executor.submit(
+                        render_job, *job, timeout=self.timeout)
+                except BrokenProcessPool:
+                    self._reset(executor)
+                    future = self._executor().submit(
+                        render_job, *job, timeout=self.timeout)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        # A job that overruns its timeout keeps its slot until the worker
+        # is actually free again
+        future.add_done_callback(lambda future: self.slots.release())
+        return future
+
+    def result(self, future):
+        try:
+            if not self.workers:
+                return future.result()
+            # The worker enforces the timeout itself, this is a backstop
+            # for jobs stuck outside the interpreter
+            with metrics.timed('render'):
+                return future.result(
+                    self.timeout + 1 if self.timeout else None)
+        except concurrent.futures.TimeoutError:
+            raise RenderTimeout('Rendering took too long')
+        except BrokenProcessPool:
+            if self.executor is not None:
+                self._reset(self.executor)
+            raise MapmakerError('The render worker crashed, try again')
+
+    def render(self, *job):
+        return self.result(self.submit(*job))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RenderPool(RENDER_WORKERS, RENDER_QUEUE, RENDER_TIMEOUT)
+        return _pool